@@ -1,5 +1,9 @@
+import asyncio
 import logging
+import sqlite3
+from contextlib import closing
 from datetime import datetime, timedelta, tzinfo
+from pathlib import Path
 from zoneinfo import ZoneInfo
 
 import sentry_sdk
@@ -77,6 +81,23 @@ def _load_event_publisher(config: EventPublisherConfig) -> EventPublisher:
         raise ValueError(f"Unknown mode {config.mode}")
 
 
+def _enable_sqlite_wal(path: Path):
+    if not path.is_file():
+        raise ValueError(
+            f"SQLite rate limiting DB {path} does not exist, run the migrations first"
+        )
+
+    # The repo doesn't expose its connection, so we can only apply pragmas that are
+    # persisted in the database file. The journal mode is one of them, so it also
+    # applies to the connection the repo opens afterwards. Per-connection pragmas
+    # (synchronous, mmap_size, temp_store) can't be set this way.
+    # mode=rw makes sure we never create an empty database file.
+    with closing(
+        sqlite3.connect(f"{path.resolve().as_uri()}?mode=rw", uri=True)
+    ) as connection:
+        connection.execute("PRAGMA journal_mode=WAL")
+
+
 class _StubRateLimitPolicy(RateLimitingPolicy):
     @property
     def requested_history(self) -> int:
@@ -106,8 +127,13 @@ def _load_rate_limiter(
     repository: RateLimitingRepo
 
     if db_config is None:
-        _LOG.warning("Using in-memory rate limiting repo")
-        repository = repo.InMemoryRateLimitingRepo()
+        if config.sqlite_path is None:
+            _LOG.warning("Using in-memory rate limiting repo")
+            repository = repo.InMemoryRateLimitingRepo()
+        else:
+            _LOG.info("Using SQLite rate limiting repo at %s", config.sqlite_path)
+            _enable_sqlite_wal(config.sqlite_path)
+            repository = repo.SqliteRateLimitingRepo.connect(config.sqlite_path)
     else:
         repository = repo.PostgresRateLimitingRepo.connect(
             host=db_config.db_host,
@@ -177,7 +203,7 @@ def main():
         dementia_responder=dementia_responder,
         timezone=timezone,
     )
-    bot.run()
+    asyncio.run(bot.run())
 
 
 if __name__ == "__main__":
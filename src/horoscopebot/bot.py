@@ -1,15 +1,25 @@
+import asyncio
 import logging
 import signal
-import time
-from collections.abc import Callable
+import weakref
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
 from dataclasses import dataclass
-from datetime import UTC, datetime, tzinfo
-from typing import Any, Self, cast
-
-from httpx import Client, HTTPStatusError, Response, TimeoutException
+from datetime import date, datetime, tzinfo
+from typing import IO, Any, Self, cast
+
+import orjson
+from httpx import (
+    AsyncClient,
+    HTTPStatusError,
+    Limits,
+    Response,
+    Timeout,
+    TimeoutException,
+)
 from opentelemetry import trace
 from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
-from rate_limiter import RateLimiter
+from rate_limiter import RateLimiter, Usage
 
 from horoscopebot.config import TelegramConfig
 from horoscopebot.dementia_responder import DementiaResponder
@@ -19,14 +29,21 @@ from horoscopebot.horoscope.horoscope import Horoscope, HoroscopeResult
 _LOG = logging.getLogger(__name__)
 tracer = trace.get_tracer(__name__)
 
+_JSON_HEADERS = {"Content-Type": "application/json"}
+_HTML_PARSE = {"parse_mode": "HTML"}
+_NO_PARSE: dict[str, str] = {}
+
+_MAX_CACHED_USAGES = 10_000
+_SLOT_MACHINE = "🎰"
+
 
 class RateLimitException(Exception):
     def __init__(self, retry_after: float):
         self.retry_after = retry_after
 
     @classmethod
-    def from_response(cls, response: Response) -> Self:
-        parameters = response.json()["parameters"]
+    def from_body(cls, body: dict) -> Self:
+        parameters = body["parameters"]
         if parameters:
             return cls(retry_after=float(parameters["retry_after"]))
 
@@ -60,32 +77,60 @@ class Bot:
         self._rate_limiter = rate_limiter
         self._timezone = timezone
         self._dementia_responder = dementia_responder
-        self._session = Client()
-        HTTPXClientInstrumentor().instrument_client(self._session)
+        self._urls = {
+            method: f"https://api.telegram.org/bot{config.token}/{method}"
+            for method in ("sendMessage", "sendPhoto", "getUpdates")
+        }
+        # getUpdates gets its own connection, so slow outbound requests can't
+        # stall polling by exhausting the pool
+        self._poll_client = AsyncClient(
+            http2=True,
+            limits=Limits(max_connections=1, keepalive_expiry=120),
+            timeout=Timeout(55, connect=5, pool=1),
+        )
+        HTTPXClientInstrumentor().instrument_client(self._poll_client)
+        self._send_client = AsyncClient(
+            http2=True,
+            limits=Limits(max_connections=10),
+            timeout=Timeout(connect=5, read=35, write=20, pool=1),
+        )
+        HTTPXClientInstrumentor().instrument_client(self._send_client)
         self._should_terminate = False
+        self._poll_task: asyncio.Task | None = None
+        # Limits concurrent update handling, and thereby outbound Telegram calls
+        self._update_semaphore = asyncio.Semaphore(8)
+        self._usage_locks: weakref.WeakValueDictionary[
+            tuple[int, int], asyncio.Lock
+        ] = weakref.WeakValueDictionary()
+        # Offending usages the rate limiter reported, along with the day they were
+        # reported for. Lets us answer repeated spins without asking the repo again.
+        self._offending_usages: OrderedDict[tuple[int, int], tuple[date, Usage]] = (
+            OrderedDict()
+        )
 
-    def run(self):
-        signal.signal(signal.SIGTERM, self._on_kill)
-        signal.signal(signal.SIGINT, self._on_kill)
-        self._handle_updates(self._handle_update)
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, self._on_kill, signal.SIGTERM)
+        loop.add_signal_handler(signal.SIGINT, self._on_kill, signal.SIGINT)
+        await self._handle_updates(self._handle_update)
 
-    def _on_kill(self, kill_signal: int, _):
+    def _on_kill(self, kill_signal: int):
         _LOG.info(
             "Received %s signal, requesting termination...",
             signal.Signals(kill_signal).name,
         )
         self._should_terminate = True
-
-    def _build_url(self, method: str) -> str:
-        return f"https://api.telegram.org/bot{self.config.token}/{method}"
+        if self._poll_task is not None:
+            # Don't wait for the long poll to time out
+            self._poll_task.cancel()
 
     @staticmethod
     def _get_actual_body(response: Response):
         if response.status_code == 429:
-            raise RateLimitException.from_response(response)
+            raise RateLimitException.from_body(orjson.loads(response.content))
 
         response.raise_for_status()
-        body = response.json()
+        body = orjson.loads(response.content)
         if body.get("ok"):
             return body["result"]
         raise ValueError(f"Body was not ok! {body}")
@@ -109,43 +154,35 @@ class Bot:
 
         return chunks
 
-    def _send_message(
+    async def _send_message(
         self,
         chat_id: int,
         text: str,
         reply_to_message_id: int | None,
         use_html_parsing: bool = False,
-        image: bytes | None = None,
+        image: IO[bytes] | None = None,
     ) -> dict:
-        parsing_conf = {"parse_mode": "HTML"} if use_html_parsing else {}
         _LOG.info("Sending message with text length %d", len(text))
 
         text_limit = 4096 if image is None else 1024
         text_parts = self._split_text(text, first_limit=text_limit)
 
+        post_text = self._post_html_text if use_html_parsing else self._post_plain_text
+
         if image is None:
-            response = self._session.post(
-                self._build_url("sendMessage"),
-                json={
-                    "text": text_parts[0],
-                    "chat_id": chat_id,
-                    "reply_to_message_id": reply_to_message_id,
-                    **parsing_conf,
-                },
-            )
+            response = await post_text(chat_id, text_parts[0], reply_to_message_id)
         else:
-            response = self._session.post(
-                self._build_url("sendPhoto"),
+            response = await self._send_client.post(
+                self._urls["sendPhoto"],
                 data={
                     "caption": text_parts[0],
                     "chat_id": chat_id,
                     "reply_to_message_id": reply_to_message_id,
-                    **parsing_conf,
+                    **(_HTML_PARSE if use_html_parsing else _NO_PARSE),
                 },
                 files={
-                    "photo": image,
+                    "photo": ("horoscope.png", image, "image/png"),
                 },
-                timeout=20,
             )
 
         if reply_to_message_id is not None and response.status_code == 400:
@@ -153,20 +190,50 @@ class Bot:
 
         if response.is_success:
             for text_part in text_parts[1:]:
-                self._session.post(
-                    self._build_url("sendMessage"),
-                    json={
-                        "text": text_part,
-                        "chat_id": chat_id,
-                        **parsing_conf,
-                    },
-                )
+                await post_text(chat_id, text_part, None)
 
         return self._get_actual_body(response)
 
-    def _publish_horoscope_event(self, event: HoroscopeEvent):
+    async def _post_plain_text(
+        self,
+        chat_id: int,
+        text: str,
+        reply_to_message_id: int | None,
+    ) -> Response:
+        return await self._send_client.post(
+            self._urls["sendMessage"],
+            content=orjson.dumps(
+                {
+                    "text": text,
+                    "chat_id": chat_id,
+                    "reply_to_message_id": reply_to_message_id,
+                }
+            ),
+            headers=_JSON_HEADERS,
+        )
+
+    async def _post_html_text(
+        self,
+        chat_id: int,
+        text: str,
+        reply_to_message_id: int | None,
+    ) -> Response:
+        return await self._send_client.post(
+            self._urls["sendMessage"],
+            content=orjson.dumps(
+                {
+                    "text": text,
+                    "chat_id": chat_id,
+                    "reply_to_message_id": reply_to_message_id,
+                    "parse_mode": "HTML",
+                }
+            ),
+            headers=_JSON_HEADERS,
+        )
+
+    async def _publish_horoscope_event(self, event: HoroscopeEvent):
         try:
-            self._event_publisher.publish(event)
+            await asyncio.to_thread(self._event_publisher.publish, event)
         except EventPublishingException as e:
             _LOG.error("Could not publish event", exc_info=e)
 
@@ -174,7 +241,45 @@ class Bot:
     def _is_lemons(dice: int) -> bool:
         return dice == 43
 
-    def _handle_update(self, update: dict[str, Any]):
+    def _get_usage_lock(self, chat_id: int, user_id: int) -> asyncio.Lock:
+        key = (chat_id, user_id)
+        lock = self._usage_locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._usage_locks[key] = lock
+        return lock
+
+    def _get_offending_usage(
+        self,
+        chat_id: int,
+        user_id: int,
+        time: datetime,
+    ) -> Usage | None:
+        key = (chat_id, user_id)
+        day = time.date()
+
+        cached = self._offending_usages.get(key)
+        if cached is not None:
+            cached_day, usage = cached
+            if cached_day == day:
+                self._offending_usages.move_to_end(key)
+                return usage
+            del self._offending_usages[key]
+
+        usage = self._rate_limiter.get_offending_usage(
+            context_id=chat_id,
+            user_id=user_id,
+            at_time=time,
+        )
+
+        if usage is not None:
+            self._offending_usages[key] = (day, usage)
+            if len(self._offending_usages) > _MAX_CACHED_USAGES:
+                self._offending_usages.popitem(last=False)
+
+        return usage
+
+    async def _handle_update(self, update: dict[str, Any]):
         with tracer.start_as_current_span("handle_update") as span:
             span = cast(trace.Span, span)
             span.set_attribute("telegram.update_keys", list(update.keys()))
@@ -189,15 +294,6 @@ class Bot:
 
             chat_id = message["chat"]["id"]
             span.set_attribute("telegram.chat_id", chat_id)
-            user_id = message["from"]["id"]
-            span.set_attribute("telegram.user_id", user_id)
-            time = datetime.fromtimestamp(
-                message["date"],
-                tz=UTC,
-            ).astimezone(self._timezone)
-            span.set_attribute("telegram.message_timestamp", time.isoformat())
-            message_id = message["message_id"]
-            span.set_attribute("telegram.message_id", message_id)
 
             if chat_id not in self.config.enabled_chats:
                 _LOG.debug("Not enabled in chat %d", chat_id)
@@ -208,106 +304,146 @@ class Bot:
                 _LOG.debug("Skipping non-dice message")
                 return
 
-            if dice["emoji"] != "🎰":
+            if dice["emoji"] != _SLOT_MACHINE:
                 _LOG.debug("Skipping non-slot-machine message")
                 return
 
             span.set_attribute("is_processed", True)
 
-            dice_value = dice["value"]
-
-            conflicting_usage = self._rate_limiter.get_offending_usage(
-                context_id=chat_id,
-                user_id=user_id,
-                at_time=time,
-            )
-
-            if conflicting_usage is not None:
-                if self._is_lemons(dice_value):
-                    # The other bot will send the picture anyway, so we'll be quiet
-                    return
+            user_id = message["from"]["id"]
+            span.set_attribute("telegram.user_id", user_id)
+            time = datetime.fromtimestamp(message["date"], tz=self._timezone)
+            span.set_attribute("telegram.message_timestamp", time.isoformat())
+            message_id = message["message_id"]
+            span.set_attribute("telegram.message_id", message_id)
 
-                response = self._dementia_responder.create_response(
-                    current_message_id=message_id,
-                    current_message_time=time,
-                    usage=conflicting_usage,
+            # Updates are handled concurrently, so make sure the same user can't
+            # slip a second spin in between the usage check and add_usage.
+            async with self._get_usage_lock(chat_id, user_id):
+                await self._handle_slot_machine(
+                    chat_id=chat_id,
+                    user_id=user_id,
+                    message_id=message_id,
+                    time=time,
+                    dice_value=dice["value"],
                 )
-                reply_message_id = response.reply_message_id or message_id
-                try:
-                    self._send_message(
-                        chat_id=chat_id,
-                        reply_to_message_id=reply_message_id,
-                        text=response.text,
-                    )
-                except ReplyMessageGoneException as e:
-                    _LOG.error("Could not reply to message", exc_info=e)
 
-                return
+    async def _handle_slot_machine(
+        self,
+        chat_id: int,
+        user_id: int,
+        message_id: int,
+        time: datetime,
+        dice_value: int,
+    ):
+        conflicting_usage = self._get_offending_usage(
+            chat_id=chat_id,
+            user_id=user_id,
+            time=time,
+        )
 
-            horoscope_result: HoroscopeResult | None = None
-            if not self._is_lemons(dice_value):
-                with tracer.start_as_current_span("provide_horoscope"):
-                    horoscope_result = self.horoscope.provide_horoscope(
-                        dice=dice_value,
-                        context_id=chat_id,
-                        user_id=user_id,
-                        message_id=message_id,
-                        message_time=time,
-                    )
+        if conflicting_usage is not None:
+            if self._is_lemons(dice_value):
+                # The other bot will send the picture anyway, so we'll be quiet.
+                # The offending usage is cached by now, so repeated spins won't hit
+                # the repo again today.
+                return
 
-            response_id: str | None = None
-            if horoscope_result is None:
-                _LOG.debug(
-                    "Not sending horoscope because horoscope returned None for %d",
-                    dice["value"],
+            response = self._dementia_responder.create_response(
+                current_message_id=message_id,
+                current_message_time=time,
+                usage=conflicting_usage,
+            )
+            reply_message_id = response.reply_message_id or message_id
+            try:
+                await self._send_message(
+                    chat_id=chat_id,
+                    reply_to_message_id=reply_message_id,
+                    text=response.text,
                 )
-            else:
-                try:
-                    response_message = self._send_message(
-                        chat_id=chat_id,
-                        text=horoscope_result.formatted_message,
-                        image=horoscope_result.image,
-                        use_html_parsing=horoscope_result.should_use_html_parsing,
-                        reply_to_message_id=message_id,
-                    )
-                except ReplyMessageGoneException as e:
-                    _LOG.error("Could not reply to message", exc_info=e)
-                    return
-
-                response_message_id = response_message["message_id"]
-                response_id = str(response_message_id)
-                self._publish_horoscope_event(
-                    HoroscopeEvent(
-                        chat_id=chat_id,
-                        user_id=user_id,
-                        message_id=response_message_id,
-                        horoscope=horoscope_result.message,
-                    )
+            except ReplyMessageGoneException as e:
+                _LOG.error("Could not reply to message", exc_info=e)
+
+            return
+
+        horoscope_result: HoroscopeResult | None = None
+        if not self._is_lemons(dice_value):
+            with tracer.start_as_current_span("provide_horoscope"):
+                horoscope_result = await asyncio.to_thread(
+                    self.horoscope.provide_horoscope,
+                    dice=dice_value,
+                    context_id=chat_id,
+                    user_id=user_id,
+                    message_id=message_id,
+                    message_time=time,
                 )
 
-            self._rate_limiter.add_usage(
-                context_id=chat_id,
+        response_id: str | None = None
+        horoscope_event: HoroscopeEvent | None = None
+        if horoscope_result is None:
+            _LOG.debug(
+                "Not sending horoscope because horoscope returned None for %d",
+                dice_value,
+            )
+        else:
+            try:
+                response_message = await self._send_message(
+                    chat_id=chat_id,
+                    text=horoscope_result.formatted_message,
+                    image=horoscope_result.image,
+                    use_html_parsing=horoscope_result.should_use_html_parsing,
+                    reply_to_message_id=message_id,
+                )
+            except ReplyMessageGoneException as e:
+                _LOG.error("Could not reply to message", exc_info=e)
+                return
+
+            response_message_id = response_message["message_id"]
+            response_id = str(response_message_id)
+            horoscope_event = HoroscopeEvent(
+                chat_id=chat_id,
                 user_id=user_id,
-                time=time,
-                reference_id=str(message_id),
-                response_id=response_id,
+                message_id=response_message_id,
+                horoscope=horoscope_result.message,
             )
 
-    def _request_updates(
-        self, client: Client, last_update_id: int | None
-    ) -> list[dict]:
-        body = {
-            "timeout": 10,
+        publication: asyncio.Task | None = None
+        if horoscope_event is not None:
+            # Publishing happens in a worker thread, so it overlaps with adding the
+            # usage below
+            publication = asyncio.create_task(
+                self._publish_horoscope_event(horoscope_event)
+            )
+            # Let the task start and hand the publication off to its thread
+            await asyncio.sleep(0)
+
+        # Not offloaded to a thread because repos (e.g. SQLite connections) may be
+        # bound to the thread that created them.
+        self._rate_limiter.add_usage(
+            context_id=chat_id,
+            user_id=user_id,
+            time=time,
+            reference_id=str(message_id),
+            response_id=response_id,
+        )
+
+        if publication is not None:
+            await publication
+
+    async def _request_updates(self, last_update_id: int | None) -> list[dict]:
+        body: dict[str, Any] = {
+            "timeout": 50,
+            "allowed_updates": ["message"],
         }
         if last_update_id:
             body["offset"] = last_update_id + 1
 
         try:
             return self._get_actual_body(
-                client.post(
-                    self._build_url("getUpdates"),
-                    json=body,
-                    timeout=15,
+                await self._poll_client.post(
+                    self._urls["getUpdates"],
+                    content=orjson.dumps(body),
+                    headers=_JSON_HEADERS,
                 )
             )
         except TimeoutException as e:
@@ -318,26 +454,53 @@ class Bot:
                 "Sent too many requests to Telegram, retrying after %f seconds",
                 e.retry_after,
             )
-            time.sleep(e.retry_after)
+            await asyncio.sleep(e.retry_after)
             return []
         except HTTPStatusError as e:
             _LOG.error("Got HTTPStatusError when requesting updates", exc_info=e)
             return []
 
-    def _handle_updates(self, handler: Callable[[dict], None]):
+    async def _handle_update_guarded(
+        self,
+        handler: Callable[[dict], Awaitable[None]],
+        update: dict,
+    ):
+        async with self._update_semaphore:
+            try:
+                await handler(update)
+            except Exception as e:
+                _LOG.error("Could not handle update", exc_info=e)
+
+    async def _handle_updates(self, handler: Callable[[dict], Awaitable[None]]):
         last_update_id: int | None = None
-        client = Client()
         try:
             while not self._should_terminate:
-                updates = self._request_updates(client, last_update_id)
+                self._poll_task = asyncio.create_task(
+                    self._request_updates(last_update_id)
+                )
                 try:
-                    for update in updates:
-                        _LOG.info(f"Received update: {update}")
-                        handler(update)
-                        last_update_id = update["update_id"]
-                except Exception as e:
-                    _LOG.error("Could not handle update", exc_info=e)
+                    updates = await self._poll_task
+                except asyncio.CancelledError:
+                    if self._should_terminate:
+                        break
+                    raise
+                if not updates:
+                    continue
+
+                _LOG.info("Received %d updates", len(updates))
+                tasks = []
+                for update in updates:
+                    _LOG.debug("Received update: %s", update)
+                    tasks.append(
+                        asyncio.create_task(
+                            self._handle_update_guarded(handler, update)
+                        )
+                    )
+                # Handling an update may take a while (e.g. OpenAI requests), so the
+                # whole batch is handled concurrently.
+                await asyncio.gather(*tasks, return_exceptions=True)
+                last_update_id = updates[-1]["update_id"]
             _LOG.info("Stopping update handling because of terminate signal")
         finally:
-            client.close()
-            self._session.close()
+            await self._poll_client.aclose()
+            await self._send_client.aclose()
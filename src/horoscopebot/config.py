@@ -1,6 +1,7 @@
 import logging
 from dataclasses import dataclass
 from enum import Enum
+from pathlib import Path
 from typing import Self
 
 from bs_config import Env
@@ -95,23 +96,27 @@ class EventPublisherConfig:
 class RateLimitConfig:
     rate_limiter_type: str
     db_config: DatabaseConfig | None
+    sqlite_path: Path | None
     admin_pass: bool
 
     @classmethod
     def from_env(cls, env: Env) -> Self:
+        sqlite_path = env.get_string("RATE_LIMIT_SQLITE_PATH")
+
         return cls(
             rate_limiter_type=env.get_string(
                 "RATE_LIMITER_TYPE",
                 default="actual",
             ),
             db_config=DatabaseConfig.from_env(env.scoped("DB_")),
+            sqlite_path=Path(sqlite_path) if sqlite_path else None,
             admin_pass=env.get_bool("RATE_LIMIT_ADMIN_PASS", default=True),
         )
 
 
 @dataclass
 class TelegramConfig:
-    enabled_chats: list[int]
+    enabled_chats: frozenset[int]
     token: str
 
     @classmethod
@@ -119,9 +124,11 @@ class TelegramConfig:
         token = env.get_string("TELEGRAM_TOKEN", required=True)
 
         return cls(
-            enabled_chats=env.get_int_list(
-                "TELEGRAM_ENABLED_CHATS",
-                default=[133399998],
+            enabled_chats=frozenset(
+                env.get_int_list(
+                    "TELEGRAM_ENABLED_CHATS",
+                    default=[133399998],
+                )
             ),
             token=token,
         )
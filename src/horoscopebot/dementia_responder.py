@@ -1,7 +1,7 @@
 import logging
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from rate_limiter import Usage
 
@@ -17,6 +17,22 @@ _DAY_NAMES = [
     "Sonntag",
 ]
 
+# Indexed by the weekday of the current message, then the weekday of the usage
+_WEEK_TEXTS = [
+    [
+        "Du hast dein Schicksal für diese Woche vorhin schon erfahren!"
+        if current_weekday == weekday
+        else "Du hast dein Schicksal für diese Woche gestern schon erfahren!"
+        if current_weekday - weekday == 1
+        else f"Du hast dein Schicksal für diese Woche schon am {day_name} erfahren!"
+        for weekday, day_name in enumerate(_DAY_NAMES)
+    ]
+    for current_weekday in range(len(_DAY_NAMES))
+]
+
+_TEN_MINUTES = 600
+_FOUR_HOURS = 14400
+
 
 @dataclass
 class Response:
@@ -42,14 +58,17 @@ class WeekDementiaResponder(DementiaResponder):
         current_message_time: datetime,
         usage: Usage,
     ) -> Response:
+        time_diff = abs(
+            int(current_message_time.timestamp()) - int(usage.time.timestamp())
+        )
+
         reference_id = usage.reference_id
         message_id = None if reference_id is None else int(reference_id)
 
         response_id = usage.response_id
         response_message_id = None if response_id is None else int(response_id)
 
-        time_diff = abs(current_message_time - usage.time)
-        if time_diff < timedelta(minutes=10):
+        if time_diff < _TEN_MINUTES:
             return Response(
                 "Ich habe dir dein Horoskop vor nicht mal zehn Minuten gegeben."
                 " Wirst du alt?"
@@ -57,24 +76,8 @@ class WeekDementiaResponder(DementiaResponder):
 
         reply_message_id = response_message_id or message_id
         if reply_message_id:
-            weekday = usage.time.weekday()
-            day_name = _DAY_NAMES[weekday]
-            text = (
-                f"Du hast dein Schicksal für diese Woche schon am {day_name} erfahren!"
-            )
-
-            match current_message_time.weekday() - weekday:
-                case 0:
-                    text = (
-                        "Du hast dein Schicksal für diese Woche vorhin schon erfahren!"
-                    )
-                case 1:
-                    text = (
-                        "Du hast dein Schicksal für diese Woche gestern schon erfahren!"
-                    )
-
             return Response(
-                text,
+                _WEEK_TEXTS[current_message_time.weekday()][usage.time.weekday()],
                 reply_message_id=reply_message_id,
             )
 
@@ -88,6 +91,10 @@ class DayDementiaResponder(DementiaResponder):
         current_message_time: datetime,
         usage: Usage,
     ) -> Response:
+        time_diff = abs(
+            int(current_message_time.timestamp()) - int(usage.time.timestamp())
+        )
+
         reference_id = usage.reference_id
         message_id = None if reference_id is None else int(reference_id)
 
@@ -97,8 +104,7 @@ class DayDementiaResponder(DementiaResponder):
         if response_message_id == current_message_id - 1:
             return Response("Dein Horoskop steht direkt über deiner Slot Machine 🎰!")
 
-        time_diff = abs(current_message_time - usage.time)
-        if time_diff < timedelta(minutes=10):
+        if time_diff < _TEN_MINUTES:
             return Response(
                 "Ich habe dir dein Horoskop vor nicht mal zehn Minuten gegeben."
                 " Wirst du alt?"
@@ -113,7 +119,7 @@ class DayDementiaResponder(DementiaResponder):
                     "Hast du nen Filmriss?"
                     " Dein Horoskop hast du gestern Nacht schon erfragt!"
                 )
-            elif time_diff > timedelta(hours=4) and usage.time.hour < 11:
+            elif time_diff > _FOUR_HOURS and usage.time.hour < 11:
                 text = "Du hast dein Schicksal doch heute Morgen schon erfahren!"
             elif usage.time.hour < 15 and current_message_time.hour > 18:
                 text = "Es wird auch abends nicht besser."
@@ -1,14 +1,17 @@
 import abc
 import dataclasses
-import json
+from functools import cached_property
+
+import orjson
 
 
 @dataclasses.dataclass
 class Event(abc.ABC):
     chat_id: int
 
-    def serialize(self) -> bytes:
-        return json.dumps(dataclasses.asdict(self)).encode("utf-8")
+    @cached_property
+    def payload(self) -> bytes:
+        return orjson.dumps(dataclasses.asdict(self))
 
 
 class EventPublishingException(Exception):
@@ -21,7 +21,7 @@ class PubSubEventPublisher(EventPublisher):
         _LOG.debug("Publishing event %s", event)
         future = self.client.publish(
             topic=self.topic,
-            data=event.serialize(),
+            data=event.payload,
         )
         try:
             future.result(timeout=60)
@@ -2,12 +2,13 @@ import abc
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum, auto
+from typing import IO
 
 
 @dataclass
 class HoroscopeResult:
     message: str
-    image: bytes | None = None
+    image: IO[bytes] | None = None
 
     @property
     def should_use_html_parsing(self) -> bool:
@@ -1,9 +1,10 @@
+import io
 import logging
 import random
 from collections.abc import Sequence
 from dataclasses import dataclass
 from datetime import datetime
-from typing import cast
+from typing import IO, cast
 
 import httpx
 from httpx import RequestError
@@ -301,7 +302,7 @@ class OpenAiChatHoroscope(Horoscope):
         messages: list[ChatCompletionMessageParam],
         *,
         improve_prompt: bool = True,
-    ) -> bytes | None:
+    ) -> IO[bytes] | None:
         if improve_prompt:
             improvement_message = self._improve_image_prompt(messages) or messages[-1]
         else:
@@ -352,4 +353,4 @@ class OpenAiChatHoroscope(Horoscope):
             )
             return None
 
-        return response.content
+        return io.BytesIO(response.content)
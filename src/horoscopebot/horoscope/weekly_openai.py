@@ -1,8 +1,9 @@
+import io
 import logging
 from collections.abc import Sequence
 from dataclasses import dataclass
 from datetime import datetime
-from typing import cast
+from typing import IO, cast
 
 import httpx
 from httpx import RequestError
@@ -209,7 +210,7 @@ class WeeklyOpenAiHoroscope(Horoscope):
         messages: list[ChatCompletionMessageParam],
         *,
         improve_prompt: bool = True,
-    ) -> bytes | None:
+    ) -> IO[bytes] | None:
         if improve_prompt:
             improvement_message = self._improve_image_prompt(messages) or messages[-1]
         else:
@@ -260,4 +261,4 @@ class WeeklyOpenAiHoroscope(Horoscope):
             )
             return None
 
-        return response.content
+        return io.BytesIO(response.content)
@@ -0,0 +1,112 @@
+import asyncio
+from collections.abc import Iterator
+from datetime import UTC, datetime, timedelta
+from typing import cast
+
+import pytest
+from rate_limiter import RateLimiter, Usage
+
+from horoscopebot import bot as bot_module
+from horoscopebot.bot import Bot
+from horoscopebot.config import TelegramConfig
+from horoscopebot.dementia_responder import DayDementiaResponder
+from horoscopebot.event.stub import StubEventPublisher
+from horoscopebot.horoscope.steffen import SteffenHoroscope
+
+
+class FakeRateLimiter:
+    def __init__(self, usage: Usage | None):
+        self.usage = usage
+        self.calls = 0
+
+    def get_offending_usage(
+        self,
+        context_id: int,
+        user_id: int,
+        at_time: datetime,
+    ) -> Usage | None:
+        self.calls += 1
+        return self.usage
+
+
+@pytest.fixture()
+def usage() -> Usage:
+    return Usage(
+        context_id="1",
+        user_id="2",
+        time=datetime(2024, 1, 3, 9, tzinfo=UTC),
+        reference_id="2",
+        response_id="5",
+    )
+
+
+@pytest.fixture()
+def now() -> datetime:
+    return datetime(2024, 1, 3, 18, tzinfo=UTC)
+
+
+def _create_bot(rate_limiter: FakeRateLimiter) -> Bot:
+    return Bot(
+        TelegramConfig(enabled_chats=frozenset([1]), token="token"),
+        horoscope=SteffenHoroscope(),
+        event_publisher=StubEventPublisher(),
+        rate_limiter=cast(RateLimiter, rate_limiter),
+        dementia_responder=DayDementiaResponder(),
+        timezone=UTC,
+    )
+
+
+@pytest.fixture()
+def rate_limiter(usage) -> FakeRateLimiter:
+    return FakeRateLimiter(usage)
+
+
+@pytest.fixture()
+def bot(rate_limiter) -> Iterator[Bot]:
+    bot = _create_bot(rate_limiter)
+    yield bot
+
+    async def close():
+        await bot._poll_client.aclose()
+        await bot._send_client.aclose()
+
+    asyncio.run(close())
+
+
+def test_offending_usage_cached_same_day(bot, rate_limiter, usage, now):
+    assert bot._get_offending_usage(1, 2, now) is usage
+    assert bot._get_offending_usage(1, 2, now + timedelta(minutes=5)) is usage
+    assert rate_limiter.calls == 1
+
+
+def test_offending_usage_cache_expires_next_day(bot, rate_limiter, now):
+    bot._get_offending_usage(1, 2, now)
+
+    rate_limiter.usage = None
+    assert bot._get_offending_usage(1, 2, now + timedelta(days=1)) is None
+    assert rate_limiter.calls == 2
+    assert (1, 2) not in bot._offending_usages
+
+
+def test_no_offending_usage_not_cached(bot, rate_limiter, now):
+    rate_limiter.usage = None
+
+    assert bot._get_offending_usage(1, 2, now) is None
+    assert bot._get_offending_usage(1, 2, now) is None
+    assert rate_limiter.calls == 2
+    assert not bot._offending_usages
+
+
+def test_offending_usage_cache_evicts_least_recently_used(
+    bot, rate_limiter, now, monkeypatch
+):
+    monkeypatch.setattr(bot_module, "_MAX_CACHED_USAGES", 2)
+
+    bot._get_offending_usage(1, 1, now)
+    bot._get_offending_usage(1, 2, now)
+    # Makes (1, 2) the least recently used entry
+    bot._get_offending_usage(1, 1, now)
+    bot._get_offending_usage(1, 3, now)
+
+    assert list(bot._offending_usages) == [(1, 1), (1, 3)]
+    assert rate_limiter.calls == 3
@@ -4,7 +4,7 @@ from datetime import UTC, datetime, timedelta
 import pytest
 from rate_limiter import Usage
 
-from horoscopebot.dementia_responder import DayDementiaResponder
+from horoscopebot.dementia_responder import DayDementiaResponder, WeekDementiaResponder
 
 
 @pytest.fixture()
@@ -44,3 +44,24 @@ def test_ten_minute_rule_too_long(responder: DayDementiaResponder, usage):
         usage,
     )
     assert "nicht mal zehn Minuten" not in response.text
+
+
+@pytest.mark.parametrize(
+    "days_ago,expected",
+    [
+        (0, "vorhin"),
+        (1, "gestern"),
+        (2, "am Montag"),
+    ],
+)
+def test_week_texts(usage, days_ago: int, expected: str):
+    # 2024-01-03 is a Wednesday
+    now = datetime(2024, 1, 3, 18, tzinfo=UTC)
+    usage = dataclasses.replace(usage, time=now - timedelta(days=days_ago, hours=1))
+    response = WeekDementiaResponder().create_response(
+        10,
+        now,
+        usage,
+    )
+    assert expected in response.text
+    assert response.reply_message_id == 5